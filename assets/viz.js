@@ -0,0 +1,123 @@
+/* Client-side rendering of the search results held in the dcc.Store components.
+ * Registered as the "viz" namespace and wired up with clientside_callback in dashboard.py.
+ */
+
+// Same palette and dash styles as Plotly Express, so charts look as they did
+const COLORS = ['#636efa', '#EF553B', '#00cc96', '#ab63fa', '#FFA15A',
+                '#19d3f3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52'];
+const DASHES = ['solid', 'dot', 'dash', 'longdash', 'dashdot', 'longdashdot'];
+
+function emptyFigure(title) {
+    return {data: [], layout: {title: {text: title}}};
+}
+
+// Group rows by a key while keeping the order in which keys first appear
+function groupBy(rows, key) {
+    const groups = new Map();
+    rows.forEach(function (row) {
+        const value = key(row);
+        if (!groups.has(value)) {
+            groups.set(value, []);
+        }
+        groups.get(value).push(row);
+    });
+    return groups;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    viz: {
+        render_message: function (results) {
+            if (!results) {
+                return window.dash_clientside.no_update;
+            }
+            if (!results.products.length) {
+                return `No results found for '${results.search_term}'. Try scraping data first.`;
+            }
+            return `Found ${results.products.length} results for '${results.search_term}'`;
+        },
+
+        render_comparison: function (results) {
+            if (!results) {
+                return window.dash_clientside.no_update;
+            }
+            if (!results.products.length) {
+                return emptyFigure('No data available');
+            }
+
+            // One bar trace per website, like px.bar(color='website')
+            const traces = [];
+            groupBy(results.products, row => row.website).forEach(function (rows, website) {
+                traces.push({
+                    type: 'bar',
+                    name: website,
+                    x: rows.map(row => row.product_name),
+                    y: rows.map(row => row.price),
+                    customdata: rows.map(row => [row.rating, row.reviews_count, row.availability]),
+                    hovertemplate: 'Website=%{fullData.name}<br>Product=%{x}<br>Price=%{y}' +
+                        '<br>rating=%{customdata[0]}<br>reviews_count=%{customdata[1]}' +
+                        '<br>availability=%{customdata[2]}<extra></extra>',
+                    marker: {color: COLORS[traces.length % COLORS.length]}
+                });
+            });
+
+            return {
+                data: traces,
+                layout: {
+                    title: {text: `Price Comparison for '${results.search_term}'`},
+                    barmode: 'relative',
+                    xaxis: {title: {text: 'Product'}},
+                    yaxis: {title: {text: 'Price'}},
+                    legend: {title: {text: 'Website'}}
+                }
+            };
+        },
+
+        render_table: function (results) {
+            if (!results) {
+                return window.dash_clientside.no_update;
+            }
+            return results.table;
+        },
+
+        render_history: function (history) {
+            if (!history) {
+                return window.dash_clientside.no_update;
+            }
+            if (!history.history.length) {
+                return emptyFigure(history.title);
+            }
+
+            // Colour per product and dash style per website, like
+            // px.line(color='product_name', line_dash='website')
+            const products = Array.from(groupBy(history.history, row => row.product_name).keys());
+            const websites = Array.from(groupBy(history.history, row => row.website).keys());
+            const traces = [];
+            groupBy(history.history, row => row.product_name + '\u001f' + row.website).forEach(function (rows) {
+                const product = rows[0].product_name;
+                const website = rows[0].website;
+                traces.push({
+                    type: 'scatter',
+                    mode: 'lines',
+                    name: product + ', ' + website,
+                    x: rows.map(row => row.timestamp),
+                    y: rows.map(row => row.price),
+                    line: {
+                        color: COLORS[products.indexOf(product) % COLORS.length],
+                        dash: DASHES[websites.indexOf(website) % DASHES.length]
+                    },
+                    hovertemplate: '%{fullData.name}<br>Date=%{x}<br>Price=%{y}<extra></extra>'
+                });
+            });
+
+            return {
+                data: traces,
+                layout: {
+                    title: {text: history.title},
+                    xaxis: {title: {text: 'Date'}},
+                    yaxis: {title: {text: 'Price'}},
+                    legend: {title: {text: 'Product, Website'}}
+                }
+            };
+        }
+    }
+});
@@ -1,26 +1,44 @@
+import functools
+import importlib.util
 import os
+import re
 import sys
 import warnings
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
-from dash import Dash, html, dcc, callback, Output, Input, State
+import plotly.io as pio
+from dash import Dash, html, dcc, dash_table, callback, clientside_callback, ctx, no_update, ClientsideFunction, Output, Input, State
 from dash.exceptions import PreventUpdate
 from datetime import datetime, timedelta
+import queue
+import subprocess
 import threading
 import time
 
+BASE_DIR = os.path.abspath(os.path.dirname(__file__))
+
 # Add the current directory to the Python path
-sys.path.insert(0, os.path.abspath(os.path.dirname(__file__)))
+sys.path.insert(0, BASE_DIR)
+
+# Scrapy only runs in the crawl subprocesses, so check for it without importing it
+SCRAPY_AVAILABLE = importlib.util.find_spec('scrapy') is not None
+if not SCRAPY_AVAILABLE:
+    warnings.warn("Scrapy is not available. Scraping functionality will be disabled.")
 
 try:
-    import scrapy
-    from scrapy.crawler import CrawlerProcess
-    from scrapy.utils.project import get_project_settings
-    SCRAPY_AVAILABLE = True
+    import pyarrow as pa
+    from pyarrow import csv as pacsv
+    PYARROW_AVAILABLE = True
 except ImportError:
-    warnings.warn("Scrapy is not available. Scraping functionality will be disabled.")
-    SCRAPY_AVAILABLE = False
+    PYARROW_AVAILABLE = False
+
+# plotly.io imports orjson itself, so only check that it is installed
+ORJSON_AVAILABLE = importlib.util.find_spec('orjson') is not None
+
+if ORJSON_AVAILABLE:
+    # Dash serializes callback responses through plotly.io, so this makes it
+    # encode them with orjson, which handles NumPy values and datetimes natively
+    pio.json.config.default_engine = 'orjson'
 
 try:
     from database.models import Product, db_session, init_db, SQLALCHEMY_AVAILABLE
@@ -30,19 +48,29 @@ except ImportError:
     warnings.warn("Database module not found. Using CSV files only.")
     SQLALCHEMY_AVAILABLE = False
 
-# Import spiders if Scrapy is available
+# Spider names by website. The spiders are only loaded by `scrapy crawl`, so
+# just check that their modules exist
+SPIDERS = {'amazon': 'amazon', 'ebay': 'ebay', 'walmart': 'walmart'}
 if SCRAPY_AVAILABLE:
-    try:
-        from shop_scraper.spiders.amazon import AmazonSpider
-        from shop_scraper.spiders.ebay import EbaySpider
-        from shop_scraper.spiders.walmart import WalmartSpider
-        SPIDERS_AVAILABLE = True
-    except ImportError:
-        warnings.warn("Failed to import spiders. Scraping functionality will be disabled.")
-        SPIDERS_AVAILABLE = False
+    SPIDERS_AVAILABLE = all(
+        importlib.util.find_spec(f'shop_scraper.spiders.{website}') is not None for website in SPIDERS
+    )
+    if not SPIDERS_AVAILABLE:
+        warnings.warn("Failed to find spiders. Scraping functionality will be disabled.")
 else:
     SPIDERS_AVAILABLE = False
 
+# Columns of the product details table
+PRODUCT_TABLE_COLUMNS = [
+    {'name': 'Product Name', 'id': 'product_name'},
+    {'name': 'Price', 'id': 'price'},
+    {'name': 'Website', 'id': 'website'},
+    {'name': 'Availability', 'id': 'availability'},
+    {'name': 'Rating', 'id': 'rating'},
+    {'name': 'Link', 'id': 'link', 'presentation': 'markdown'},
+]
+
+
 # Create Dash app
 app = Dash(__name__, title="E-Commerce Price Tracker")
 
@@ -132,17 +160,36 @@ app.layout = html.Div([
         # Price history chart
         html.Div([
             html.H4("Price History Over Time", style={'marginTop': '20px', 'marginBottom': '10px'}),
-            dcc.Graph(id='price-history-chart')
+            dcc.Loading([
+                # History payload, filled after the fast results are shown
+                dcc.Store(id='history-store'),
+                dcc.Graph(id='price-history-chart')
+            ])
         ], style={'marginBottom': '30px'}),
         
         # Product details table
         html.Div([
             html.H4("Product Details", style={'marginTop': '20px', 'marginBottom': '10px'}),
-            html.Div(id='product-details-table')
+            # A single DataTable ships the rows as one JSON payload and renders only
+            # the visible part, instead of one html.Tr/html.Td component per cell
+            dash_table.DataTable(
+                id='product-details-table',
+                data=[],
+                columns=PRODUCT_TABLE_COLUMNS,
+                page_size=50,
+                virtualization=True,
+                markdown_options={'link_target': '_blank'},
+                style_table={'width': '100%', 'overflowX': 'auto'},
+                style_cell={'textAlign': 'left', 'padding': '12px 15px'},
+                style_header={'backgroundColor': '#4CAF50', 'color': 'white', 'fontWeight': '500'}
+            )
         ])
     ], style={'padding': '20px', 'backgroundColor': '#f9f9f9', 'borderRadius': '5px'}),
     
-    # Hidden div for storing scraping completion status
+    # Latest search results, rendered client side and consumed by the price history callback
+    dcc.Store(id='results-store'),
+    
+    # Hidden div holding the time the last scrape completed; triggers one results refresh
     html.Div(id='scraping-completed', style={'display': 'none'}),
     
     # Interval component for auto-refresh
@@ -155,105 +202,275 @@ app.layout = html.Div([
 ])
 
 
-def get_data_from_csv(search_term):
+# Mapping of CSV export headers to the product fields used by the dashboard
+CSV_COLUMNS = {
+    'Product Name': 'product_name',
+    'Price': 'price',
+    'Currency': 'currency',
+    'Website': 'website',
+    'URL': 'url',
+    'Availability': 'availability',
+    'Rating': 'rating',
+    'Reviews Count': 'reviews_count',
+    'Timestamp': 'timestamp',
+}
+
+# Only the columns the dashboard reads, with their types known up front
+_CSV_USECOLS = list(CSV_COLUMNS) + ['Search Term']
+_CSV_DTYPES = {
+    'Product Name': str,
+    'Price': 'float64',
+    'Currency': str,
+    'Website': str,
+    'URL': str,
+    'Availability': str,
+    'Rating': 'float64',
+    'Reviews Count': 'Int64',
+    'Search Term': str,
+}
+
+if PYARROW_AVAILABLE:
+    # Arrow parses in native code across threads
+    _ARROW_READ_OPTIONS = pacsv.ReadOptions(use_threads=True, block_size=1 << 20)
+    _ARROW_CONVERT_OPTIONS = pacsv.ConvertOptions(
+        column_types={
+            'Price': pa.float64(),
+            'Rating': pa.float64(),
+            'Reviews Count': pa.int64(),
+            'Timestamp': pa.timestamp('us'),
+        },
+        include_columns=_CSV_USECOLS,
+        strings_can_be_null=True
+    )
+
+
+def _read_export(file_path):
     """
-    Get data from CSV files when database is not available
+    Read a CSV export using the known schema, falling back to type inference
+    for files that don't match it (e.g. older exports missing a column)
     """
-    products = []
-    exports_dir = 'data/exports'
+    if PYARROW_AVAILABLE:
+        try:
+            table = pacsv.read_csv(
+                file_path,
+                read_options=_ARROW_READ_OPTIONS,
+                convert_options=_ARROW_CONVERT_OPTIONS
+            )
+            return table.to_pandas()
+        except (pa.ArrowInvalid, pa.ArrowKeyError):
+            # ArrowKeyError: a column is missing, which pandas below handles the same way
+            pass
+
+    try:
+        return pd.read_csv(
+            file_path,
+            usecols=_CSV_USECOLS,
+            dtype=_CSV_DTYPES,
+            parse_dates=['Timestamp'],
+            engine='c'
+        )
+    except ValueError:
+        return pd.read_csv(file_path)
+
+
+# Limits on which CSV exports are read; older files are ignored
+CSV_MAX_AGE_DAYS = 90
+CSV_MAX_FILES = 200
+
+
+def _exports_signature(exports_dir):
+    """
+    Identify the CSV exports to read by name, modification time and size.
+    Only the CSV_MAX_FILES most recent files newer than CSV_MAX_AGE_DAYS are kept.
+    """
+    cutoff_ns = time.time_ns() - CSV_MAX_AGE_DAYS * 86400 * 10**9
     
-    if not os.path.exists(exports_dir):
-        return []
+    # scandir hands back names and stat results without a separate path join + stat per file
+    entries = []
+    with os.scandir(exports_dir) as it:
+        for entry in it:
+            if not entry.name.endswith('.csv') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            if stat.st_mtime_ns >= cutoff_ns:
+                entries.append((entry.name, stat.st_mtime_ns, stat.st_size))
     
-    for filename in os.listdir(exports_dir):
-        if not filename.endswith('.csv'):
-            continue
-        
-        file_path = os.path.join(exports_dir, filename)
+    entries.sort(key=lambda entry: entry[1], reverse=True)
+    return tuple(entries[:CSV_MAX_FILES])
+
+
+# Typed Parquet copies of the CSV exports, kept in a subdirectory of the exports
+PARQUET_DIR = 'parquet'
+
+
+def _load_export(exports_dir, filename, mtime_ns):
+    """
+    Load one export, preferring its Parquet copy. A missing or outdated copy
+    is written from the CSV, so each CSV is parsed only once.
+    """
+    file_path = os.path.join(exports_dir, filename)
+    if not PYARROW_AVAILABLE:
+        return _read_export(file_path)
+    
+    parquet_path = os.path.join(exports_dir, PARQUET_DIR, os.path.splitext(filename)[0] + '.parquet')
+    try:
+        if os.stat(parquet_path).st_mtime_ns >= mtime_ns:
+            return pd.read_parquet(parquet_path, columns=_CSV_USECOLS)
+    except (OSError, pa.ArrowException):
+        pass
+    
+    df = _read_export(file_path)
+    if 'Search Term' in df.columns and 'Product Name' in df.columns:
+        df = df.reindex(columns=_CSV_USECOLS)
+        try:
+            os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+            df.to_parquet(parquet_path, index=False)
+        except (OSError, pa.ArrowException) as e:
+            print(f"Error writing {parquet_path}: {e}")
+    return df
+
+
+@functools.lru_cache(maxsize=4)
+def _load_exports(exports_dir, signature):
+    """
+    Read and combine all CSV exports. Cached on the directory signature, so
+    the files are only re-read when the scraper adds or rewrites one.
+    The returned frame is shared between calls and must not be modified.
+    """
+    frames = []
+    for filename, mtime_ns, _ in signature:
         try:
-            df = pd.read_csv(file_path)
-            # Filter by search term
-            if 'Search Term' in df.columns and 'Product Name' in df.columns:
-                filtered_df = df[df['Search Term'].str.contains(search_term, case=False, na=False) | 
-                                df['Product Name'].str.contains(search_term, case=False, na=False)]
-                
-                for _, row in filtered_df.iterrows():
-                    product = {
-                        'product_name': row.get('Product Name', ''),
-                        'price': float(row.get('Price', 0)),
-                        'currency': row.get('Currency', 'USD'),
-                        'website': row.get('Website', ''),
-                        'url': row.get('URL', ''),
-                        'availability': row.get('Availability', ''),
-                        'rating': float(row.get('Rating', 0)) if not pd.isna(row.get('Rating', 0)) else None,
-                        'reviews_count': int(row.get('Reviews Count', 0)) if not pd.isna(row.get('Reviews Count', 0)) else None,
-                        'timestamp': pd.to_datetime(row.get('Timestamp', datetime.now()))
-                    }
-                    products.append(product)
+            df = _load_export(exports_dir, filename, mtime_ns)
         except Exception as e:
-            print(f"Error reading {file_path}: {e}")
-    
-    return products
+            print(f"Error reading {os.path.join(exports_dir, filename)}: {e}")
+            continue
+
+        if 'Search Term' in df.columns and 'Product Name' in df.columns:
+            frames.append(df.reindex(columns=_CSV_USECOLS))
+
+    if not frames:
+        return None
+
+    # Combine every export so filtering and conversion run once over all rows
+    return pd.concat(frames, ignore_index=True, copy=False)
+
+
+def get_data_from_csv(search_term):
+    """
+    Get data from CSV files when database is not available
+    """
+    exports_dir = 'data/exports'
+    empty_df = pd.DataFrame(columns=list(CSV_COLUMNS.values()))
+
+    if not os.path.exists(exports_dir):
+        return empty_df
+
+    df = _load_exports(exports_dir, _exports_signature(exports_dir))
+    if df is None:
+        return empty_df
 
+    # Filter by search term, matching it literally and ignoring case.
+    # Both columns are scanned in one pass; the separator keeps matches from spanning them
+    pattern = re.compile(re.escape(search_term), re.IGNORECASE)
+    haystack = df['Search Term'].fillna('').astype(str) + '\x1f' + df['Product Name'].fillna('').astype(str)
+    filtered_df = df.loc[haystack.str.contains(pattern, regex=True, na=False)]
 
-# Global variable to track scraping status
-scraping_in_progress = False
-scraping_completed_timestamp = None
+    # Convert whole columns at once instead of building each row by hand
+    filtered_df = filtered_df.rename(columns=CSV_COLUMNS).reindex(columns=list(CSV_COLUMNS.values()))
+    filtered_df['price'] = pd.to_numeric(filtered_df['price'], errors='coerce').fillna(0.0)
+    filtered_df['rating'] = pd.to_numeric(filtered_df['rating'], errors='coerce')
+    filtered_df['reviews_count'] = pd.to_numeric(filtered_df['reviews_count'], errors='coerce')
+    filtered_df['timestamp'] = pd.to_datetime(filtered_df['timestamp'], errors='coerce').fillna(pd.Timestamp.now())
+    return filtered_df
+
+
+def latest_prices(df):
+    """
+    Keep the most recent row for each product on each website
+    """
+    return df.sort_values('timestamp', kind='stable').drop_duplicates(subset=['product_name', 'website'], keep='last')
+
+
+@functools.lru_cache(maxsize=128)
+def get_latest_prices(search_term, data_version):
+    """
+    Latest database prices for a search term, cached until new rows are stored.
+    Rows are read straight into a DataFrame, skipping ORM object construction.
+    The returned frame is shared between calls and must not be modified.
+    """
+    return pd.read_sql_query(Product.latest_prices_stmt(search_term), db_session.bind, parse_dates=['timestamp'])
+
+
+# Scraping status shared between callbacks: the event is set while a scrape
+# runs, and the queue holds the completion time until a status check takes it
+scraping_event = threading.Event()
+completion_queue = queue.Queue(maxsize=1)
+scraping_lock = threading.Lock()
+
+# `scrapy crawl` subprocesses of the scrape in progress
+scraping_processes = []
 
 def run_spider(product, websites, limit):
     """
-    Run the spiders in a separate thread
+    Start one `scrapy crawl` subprocess per selected website. Each crawl gets
+    its own Twisted reactor, which can only be started once per process, so
+    running them outside the dashboard lets scrapes be repeated.
     """
-    global scraping_in_progress, scraping_completed_timestamp
+    global scraping_processes
     
-    try:
-        # Generate output file name
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        product_slug = product.lower().replace(' ', '_')
-        output_file = f"{product_slug}_{timestamp}.csv"
-        
-        # Ensure output directory exists
-        os.makedirs('data/exports', exist_ok=True)
+    # Generate output file name
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    product_slug = product.lower().replace(' ', '_')
+    
+    # Ensure output directory exists
+    os.makedirs('data/exports', exist_ok=True)
+    
+    print(f"Starting to scrape {product} from {', '.join(websites)}")
+    
+    processes = []
+    for website in websites:
+        spider_name = SPIDERS.get(website)
+        if spider_name is None:
+            continue
         
-        # Get Scrapy settings
-        settings = get_project_settings()
+        # One file per spider, since each crawl process writes its own export
+        output_file = f"{product_slug}_{spider_name}_{timestamp}.csv"
+        command = [
+            sys.executable, '-m', 'scrapy', 'crawl', spider_name,
+            '-a', f'product={product}',
+            '-a', f'output_file={output_file}'
+        ]
         
         # Set CLOSESPIDER_ITEMCOUNT if limit is provided
         if limit:
-            settings.set('CLOSESPIDER_ITEMCOUNT', limit)
-        
-        # Initialize the crawler process
-        process = CrawlerProcess(settings)
-        
-        # Determine which spiders to run
-        spiders = []
-        if 'amazon' in websites:
-            spiders.append(AmazonSpider)
-        if 'ebay' in websites:
-            spiders.append(EbaySpider)
-        if 'walmart' in websites:
-            spiders.append(WalmartSpider)
-        
-        # Configure and start each spider
-        for spider_class in spiders:
-            process.crawl(
-                spider_class,
-                product=product,
-                output_file=output_file
-            )
+            command += ['-s', f'CLOSESPIDER_ITEMCOUNT={limit}']
         
-        # Start the crawling process
-        print(f"Starting to scrape {product} from {', '.join(websites)}")
-        print(f"Results will be saved to data/exports/{output_file}")
-        
-        process.start()
-        
-        print("Scraping completed!")
-        scraping_completed_timestamp = datetime.now()
-    except Exception as e:
-        print(f"Error during scraping: {e}")
-    finally:
-        scraping_in_progress = False
+        try:
+            processes.append(subprocess.Popen(command, cwd=BASE_DIR))
+            print(f"Results will be saved to data/exports/{output_file}")
+        except OSError as e:
+            print(f"Error during scraping: {e}")
+    
+    scraping_processes = processes
+    if processes:
+        scraping_event.set()
+    return bool(processes)
+
+
+def poll_scraping():
+    """
+    Update the scraping status once every crawl subprocess has exited
+    """
+    with scraping_lock:
+        if scraping_event.is_set() and all(process.poll() is not None for process in scraping_processes):
+            print("Scraping completed!")
+            # Keep only the newest completion if an earlier one was never picked up
+            try:
+                completion_queue.get_nowait()
+            except queue.Empty:
+                pass
+            completion_queue.put_nowait(datetime.now())
+            scraping_event.clear()
 
 
 @callback(
@@ -267,22 +484,20 @@ def run_spider(product, websites, limit):
      State('auto-refresh', 'value')]
 )
 def start_scraping(n_clicks, product, websites, limit, auto_refresh):
-    global scraping_in_progress
-    
     if n_clicks == 0 or not product:
         return "", True, ""
     
     if not SCRAPY_AVAILABLE or not SPIDERS_AVAILABLE:
         return "Scraping functionality is not available. Please install Scrapy and make sure the spiders are properly configured.", True, ""
     
-    if scraping_in_progress:
-        return "Scraping is already in progress. Please wait...", True, ""
-    
-    # Set scraping flag
-    scraping_in_progress = True
-    
-    # Start scraping in a separate thread
-    threading.Thread(target=run_spider, args=(product, websites, limit)).start()
+    poll_scraping()
+    with scraping_lock:
+        if scraping_event.is_set():
+            return "Scraping is already in progress. Please wait...", True, ""
+        
+        # Start the crawl subprocesses; this sets the scraping event
+        if not run_spider(product, websites, limit):
+            return "Failed to start scraping. Check the console for details.", True, ""
     
     # Enable auto-refresh if selected
     auto_refresh_enabled = 'yes' in auto_refresh if auto_refresh else False
@@ -290,164 +505,218 @@ def start_scraping(n_clicks, product, websites, limit, auto_refresh):
     return f"Scraping '{product}' from {', '.join(websites)} with a limit of {limit} products per website. This may take a few minutes...", not auto_refresh_enabled, ""
 
 
-@callback(
-    [Output('search-results-message', 'children'),
-     Output('price-comparison-chart', 'figure'),
-     Output('price-history-chart', 'figure'),
-     Output('product-details-table', 'children')],
-    [Input('search-button', 'n_clicks'),
-     Input('interval-component', 'n_intervals')],
-    [State('search-input', 'value')]
-)
-def update_results(n_clicks, n_intervals, search_term):
-    global scraping_completed_timestamp
-    
-    # Check if this is triggered by the interval and if scraping just completed
-    if n_clicks == 0 and n_intervals > 0:
-        if not scraping_completed_timestamp or (datetime.now() - scraping_completed_timestamp).total_seconds() > 10:
-            raise PreventUpdate
-    
-    if not search_term:
-        raise PreventUpdate
+# Number of days of price history shown in the history chart
+HISTORY_DAYS = 90
+
+# Low-cardinality text columns that are grouped on as categories
+CATEGORY_COLUMNS = ('website', 'product_name', 'currency', 'availability')
+
+
+def _as_categories(df):
+    """
+    Return a copy of df with the CATEGORY_COLUMNS it has cast to category dtype,
+    so grouping runs on integer codes rather than hashing strings
+    """
+    return df.assign(**{col: df[col].astype('category') for col in CATEGORY_COLUMNS if col in df.columns})
+
+
+def _records(df):
+    """
+    Convert a DataFrame to JSON-ready records, with missing values as None
+    """
+    return df.astype(object).where(df.notna(), None).to_dict('records')
+
+
+def _data_signature():
+    """
+    Cache key describing the data currently available to the dashboard
+    """
+    if SQLALCHEMY_AVAILABLE:
+        return Product.data_version()
     
+    exports_dir = 'data/exports'
+    if not os.path.exists(exports_dir):
+        return ()
+    return _exports_signature(exports_dir)
+
+
+@functools.lru_cache(maxsize=64)
+def _render_results(search_term, data_signature):
+    """
+    Build the results-store payload for a search term: the rows behind the
+    comparison chart and the formatted details table. The browser turns it into
+    the message, chart and table (assets/viz.js), so the server never builds
+    Plotly figures or table components. The returned dict must not be modified.
+    """
     # Get products from database or CSV
     if SQLALCHEMY_AVAILABLE:
-        products = Product.get_latest_prices(search_term)
+        # Several stored search terms can match, each with its own latest row
+        df = latest_prices(get_latest_prices(search_term, data_signature))
     else:
-        products = get_data_from_csv(search_term)
-    
-    if not products:
-        return (
-            html.P(f"No results found for '{search_term}'. Try scraping data first."),
-            px.bar(title="No data available"),
-            px.line(title="No data available"),
-            html.P("No product details available")
-        )
+        df = latest_prices(get_data_from_csv(search_term))
     
-    # Create DataFrame for visualization
-    data = []
-    for product in products:
-        if hasattr(product, '__dict__'):
-            # SQLAlchemy model instance
-            product_dict = {
-                'product_name': product.product_name,
-                'price': product.price,
-                'currency': product.currency,
-                'website': product.website,
-                'url': product.url,
-                'availability': product.availability,
-                'rating': product.rating,
-                'reviews_count': product.reviews_count,
-                'timestamp': product.timestamp
-            }
-            data.append(product_dict)
-        else:
-            # Dictionary from CSV
-            data.append(product)
-    
-    df = pd.DataFrame(data)
-    
-    # Price comparison chart
-    fig_comparison = px.bar(
-        df, 
-        x='product_name', 
-        y='price', 
-        color='website',
-        title=f"Price Comparison for '{search_term}'",
-        labels={'product_name': 'Product', 'price': 'Price', 'website': 'Website'},
-        hover_data=['rating', 'reviews_count', 'availability']
+    if df.empty:
+        return {'search_term': search_term, 'products': [], 'table': []}
+    
+    # Product details table, cheapest first.
+    # Cells are formatted a column at a time rather than with an f-string per row
+    table_df = df.sort_values('price', kind='stable', ignore_index=True)
+    currency = table_df['currency'].astype(object).fillna('USD')
+    availability = table_df['availability'].astype(object)
+    url = table_df['url'].astype(object)
+    # Columns that are NULL in every row come back from SQLite as object dtype
+    # full of None, so make them numeric (NaN) before formatting
+    rating = pd.to_numeric(table_df['rating'], errors='coerce')
+    reviews_count = pd.to_numeric(table_df['reviews_count'], errors='coerce')
+    has_rating = rating.notna() & rating.ne(0) & reviews_count.notna() & reviews_count.ne(0)
+    rating_str = (
+        rating.map('{:.1f}'.format) + ' (' +
+        reviews_count.fillna(0).astype('int64').astype(str) + ' reviews)'
     )
     
-    # Price history chart (if we have historical data)
+    table_data = pd.DataFrame({
+        'product_name': table_df['product_name'].astype(object),
+        'price': table_df['price'].map('{:.2f}'.format) + ' ' + currency,
+        'website': table_df['website'].astype(object),
+        'availability': availability.where(availability.notna() & availability.ne(''), "Unknown"),
+        'rating': rating_str.where(has_rating, "No ratings"),
+        'link': ('[View](' + url.fillna('') + ')').where(url.notna() & url.ne(''), "No link")
+    })
+    
+    return {
+        'search_term': search_term,
+        'products': _records(df[['product_name', 'price', 'website', 'rating', 'reviews_count', 'availability']]),
+        'table': _records(table_data)
+    }
+
+
+@functools.lru_cache(maxsize=64)
+def _render_history(search_term, data_signature):
+    """
+    Build the history-store payload for a search term: daily price points per
+    product and website, or the title to show when there are none
+    """
+    since = datetime.now() - timedelta(days=HISTORY_DAYS)
+    
     if SQLALCHEMY_AVAILABLE:
-        history_data = []
-        for product in products:
-            history = Product.get_price_history(product.product_name, product.website)
-            for hist_item in history:
-                history_data.append({
-                    'product_name': hist_item.product_name,
-                    'price': hist_item.price,
-                    'website': hist_item.website,
-                    'timestamp': hist_item.timestamp
-                })
+        latest_df = get_latest_prices(search_term, data_signature)
+        if latest_df.empty:
+            return {'search_term': search_term, 'history': [], 'title': "No data available"}
         
-        if history_data:
-            history_df = pd.DataFrame(history_data)
-            fig_history = px.line(
-                history_df, 
-                x='timestamp', 
-                y='price', 
-                color='product_name',
-                line_dash='website',
-                title=f"Price History for '{search_term}'",
-                labels={'timestamp': 'Date', 'price': 'Price', 'product_name': 'Product', 'website': 'Website'}
-            )
-        else:
-            fig_history = px.line(title="No historical data available")
+        # Fetch the recent history of every listed product in a single query
+        pairs = list(latest_df[['product_name', 'website']].drop_duplicates().itertuples(index=False, name=None))
+        history_df = pd.read_sql_query(Product.history_stmt(pairs, since), db_session.bind, parse_dates=['timestamp'])
     else:
-        fig_history = px.line(title="Historical data requires database functionality")
-    
-    # Product details table
-    table_rows = []
-    for product in sorted(data, key=lambda x: x['price']):
-        price_str = f"{product['price']:.2f} {product['currency']}"
-        rating_str = f"{product['rating']:.1f} ({product['reviews_count']} reviews)" if product['rating'] and product['reviews_count'] else "No ratings"
+        # Every matching CSV row is a point in the product's history
+        history_df = get_data_from_csv(search_term)
+        if history_df.empty:
+            return {'search_term': search_term, 'history': [], 'title': "No data available"}
         
-        row = html.Tr([
-            html.Td(product['product_name']),
-            html.Td(price_str),
-            html.Td(product['website']),
-            html.Td(product['availability'] if product['availability'] else "Unknown"),
-            html.Td(rating_str),
-            html.Td(html.A("View", href=product['url'], target="_blank") if product['url'] else "No link")
-        ])
-        table_rows.append(row)
-    
-    table = html.Table([
-        html.Thead(
-            html.Tr([
-                html.Th("Product Name"),
-                html.Th("Price"),
-                html.Th("Website"),
-                html.Th("Availability"),
-                html.Th("Rating"),
-                html.Th("Link")
-            ])
-        ),
-        html.Tbody(table_rows)
-    ], style={'width': '100%', 'border-collapse': 'collapse'})
-    
-    # Reset scraping completion timestamp
-    if scraping_completed_timestamp:
-        scraping_completed_timestamp = None
-    
-    return (
-        html.P(f"Found {len(products)} results for '{search_term}'"),
-        fig_comparison,
-        fig_history,
-        table
+        history_df = history_df.loc[history_df['timestamp'] >= since, ['product_name', 'price', 'website', 'timestamp']]
+    
+    if history_df.empty:
+        return {'search_term': search_term, 'history': [], 'title': "No historical data available"}
+    
+    # One point per product, website and day keeps the chart size bounded
+    history_df = (
+        _as_categories(history_df).set_index('timestamp')
+        .groupby(['product_name', 'website'], observed=True)['price']
+        .resample('D').last()
+        .dropna()
+        .reset_index()
     )
+    history_df['timestamp'] = history_df['timestamp'].dt.strftime('%Y-%m-%d')
+    
+    return {
+        'search_term': search_term,
+        'history': _records(history_df),
+        'title': f"Price History for '{search_term}'"
+    }
+
+
+@callback(
+    Output('results-store', 'data'),
+    [Input('search-button', 'n_clicks'),
+     Input('scraping-completed', 'children')],
+    [State('search-input', 'value')]
+)
+def update_results(n_clicks, scraping_completed, search_term):
+    # Refresh once when a scrape completes; the interval only polls the scraping status
+    if ctx.triggered_id == 'scraping-completed' and not scraping_completed:
+        raise PreventUpdate
+    
+    if not search_term:
+        raise PreventUpdate
+    
+    results = _render_results(search_term, _data_signature())
+    
+    # The timestamp makes a repeated search still trigger the history callback
+    return dict(results, updated=datetime.now().isoformat())
+
+
+@callback(
+    Output('history-store', 'data'),
+    Input('results-store', 'data'),
+    prevent_initial_call=True
+)
+def update_price_history(results):
+    # Runs after the fast results are on screen, so the history query doesn't delay them
+    if not results:
+        raise PreventUpdate
+    
+    return _render_history(results['search_term'], _data_signature())
+
+
+# The results are rendered in the browser from the stores (see assets/viz.js)
+clientside_callback(
+    ClientsideFunction(namespace='viz', function_name='render_message'),
+    Output('search-results-message', 'children'),
+    Input('results-store', 'data')
+)
+
+clientside_callback(
+    ClientsideFunction(namespace='viz', function_name='render_comparison'),
+    Output('price-comparison-chart', 'figure'),
+    Input('results-store', 'data')
+)
+
+clientside_callback(
+    ClientsideFunction(namespace='viz', function_name='render_table'),
+    Output('product-details-table', 'data'),
+    Input('results-store', 'data')
+)
+
+clientside_callback(
+    ClientsideFunction(namespace='viz', function_name='render_history'),
+    Output('price-history-chart', 'figure'),
+    Input('history-store', 'data')
+)
 
 
 @callback(
     [Output('scraping-status', 'children', allow_duplicate=True),
-     Output('interval-component', 'disabled', allow_duplicate=True)],
+     Output('interval-component', 'disabled', allow_duplicate=True),
+     Output('scraping-completed', 'children', allow_duplicate=True)],
     Input('interval-component', 'n_intervals'),
     prevent_initial_call=True
 )
 def check_scraping_status(n_intervals):
-    global scraping_in_progress, scraping_completed_timestamp
+    poll_scraping()
     
-    if not scraping_in_progress and scraping_completed_timestamp:
-        # Scraping just completed
-        if (datetime.now() - scraping_completed_timestamp).total_seconds() < 5:
-            return "Scraping completed! Refreshing results...", True
+    if scraping_event.is_set():
+        return "Scraping in progress...", False, no_update
+    
+    try:
+        completed = completion_queue.get_nowait()
+    except queue.Empty:
+        completed = None
     
-    if not scraping_in_progress:
-        # Disable interval once we've shown the completion message
-        return "", True
+    if completed:
+        # Scraping just completed: signal update_results once and stop polling
+        return "Scraping completed! Refreshing results...", True, completed.isoformat()
     
-    return "Scraping in progress...", False
+    # Disable interval once we've shown the completion message
+    return "", True, no_update
 
 
 if __name__ == '__main__':
@@ -1,10 +1,12 @@
+import functools
 import os
 import sys
 import warnings
 from datetime import datetime
 
 try:
-    from sqlalchemy import Column, Integer, String, Float, DateTime, create_engine, ForeignKey, func
+    from sqlalchemy import Column, Integer, String, Float, DateTime, Index, create_engine, ForeignKey, event, func, insert, select, text, tuple_
+    from sqlalchemy.exc import OperationalError
     from sqlalchemy.ext.declarative import declarative_base
     from sqlalchemy.orm import scoped_session, sessionmaker
     SQLALCHEMY_AVAILABLE = True
@@ -17,7 +19,22 @@ os.makedirs('data', exist_ok=True)
 
 if SQLALCHEMY_AVAILABLE:
     # Database setup
-    engine = create_engine('sqlite:///data/products.db')
+    # The dashboard and the scraper pipelines share the engine across threads
+    engine = create_engine('sqlite:///data/products.db', connect_args={'check_same_thread': False})
+    
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragma(dbapi_connection, connection_record):
+        # WAL lets readers and the writer work concurrently and makes each commit cheaper
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA journal_mode=WAL')
+        cursor.execute('PRAGMA synchronous=NORMAL')
+        # Serve the read-heavy dashboard queries from memory: 64 MiB page cache,
+        # 256 MiB memory-mapped reads and in-memory temporary tables for sorts
+        cursor.execute('PRAGMA cache_size=-65536')
+        cursor.execute('PRAGMA mmap_size=268435456')
+        cursor.execute('PRAGMA temp_store=MEMORY')
+        cursor.close()
+    
     db_session = scoped_session(sessionmaker(autocommit=False, autoflush=False, bind=engine))
 
     Base = declarative_base()
@@ -56,31 +73,178 @@ if SQLALCHEMY_AVAILABLE:
         
         @classmethod
         def get_products_by_search_term(cls, search_term):
+            if fts_usable(search_term):
+                return cls.query.filter(cls.id.in_(fts_matches(search_term))).all()
             return cls.query.filter(cls.search_term.like(f'%{search_term}%')).all()
         
         @classmethod
         def get_price_history(cls, product_name, website):
             return cls.query.filter_by(product_name=product_name, website=website).order_by(cls.timestamp).all()
         
+        @classmethod
+        def history_stmt(cls, pairs, since=None):
+            # Price history for several (product_name, website) pairs in one
+            # column-only SELECT, for pd.read_sql_query
+            stmt = select(
+                cls.product_name, cls.price, cls.website, cls.timestamp
+            ).where(tuple_(cls.product_name, cls.website).in_(pairs))
+            if since is not None:
+                stmt = stmt.where(cls.timestamp >= since)
+            return stmt.order_by(cls.timestamp)
+        
         @classmethod
         def get_latest_prices(cls, search_term):
             # Get the latest price for each product from each website
-            subquery = db_session.query(
+            return LatestPrice.query.filter(LatestPrice.matches(search_term)).all()
+        
+        @classmethod
+        def latest_prices_query(cls, search_terms=None):
+            # Latest row per (search_term, product_name, website), used to refresh LatestPrice
+            subquery = select(
+                cls.search_term,
                 cls.product_name,
                 cls.website,
                 func.max(cls.timestamp).label('max_timestamp')
-            ).filter(cls.search_term.like(f'%{search_term}%')).group_by(cls.product_name, cls.website).subquery()
+            )
+            if search_terms is not None:
+                subquery = subquery.where(cls.search_term.in_(search_terms))
+            subquery = subquery.group_by(cls.search_term, cls.product_name, cls.website).subquery()
             
-            return db_session.query(cls).join(
+            return select(
+                cls.search_term, cls.product_name, cls.website, cls.id, cls.price, cls.currency,
+                cls.url, cls.availability, cls.rating, cls.reviews_count, cls.timestamp
+            ).join(
                 subquery,
+                (cls.search_term == subquery.c.search_term) &
                 (cls.product_name == subquery.c.product_name) &
                 (cls.website == subquery.c.website) &
                 (cls.timestamp == subquery.c.max_timestamp)
-            ).all()
+            )
+        
+        @classmethod
+        def latest_prices_stmt(cls, search_term):
+            # Column-only SELECT on the materialized latest prices, for pd.read_sql_query
+            return LatestPrice.search_stmt(search_term)
+        
+        @classmethod
+        def data_version(cls):
+            # Changes whenever rows are added, for use as a cache key. Products are
+            # only ever appended, and max(id) is a single rowid lookup in SQLite
+            return db_session.query(func.max(cls.id)).scalar()
+    
+    class LatestPrice(Base):
+        """
+        Latest price of each product on each website per search term, copied from
+        products whenever new rows are stored so lookups skip the max-timestamp join
+        """
+        __tablename__ = 'latest_prices'
+        
+        id = Column(Integer, primary_key=True)
+        search_term = Column(String(255))
+        product_name = Column(String(255), nullable=False)
+        website = Column(String(100), nullable=False)
+        product_ref = Column(Integer, ForeignKey('products.id'))
+        price = Column(Float, nullable=False)
+        currency = Column(String(10), default='USD')
+        url = Column(String(1024))
+        availability = Column(String(50))
+        rating = Column(Float)
+        reviews_count = Column(Integer)
+        timestamp = Column(DateTime)
+        
+        def __repr__(self):
+            return f'<LatestPrice {self.product_name} ({self.website}) - {self.price} {self.currency}>'
+        
+        @classmethod
+        def refresh(cls, search_terms=None):
+            # Recompute rows for the given search terms (all when None); the caller commits
+            columns = [
+                'search_term', 'product_name', 'website', 'product_ref', 'price', 'currency',
+                'url', 'availability', 'rating', 'reviews_count', 'timestamp'
+            ]
+            stmt = insert(cls).prefix_with('OR REPLACE').from_select(columns, Product.latest_prices_query(search_terms))
+            db_session.execute(stmt)
+        
+        @classmethod
+        def get_snapshots(cls, keys):
+            # (price, availability, date) of the latest row per (search_term, product_name, website) key
+            if not keys:
+                return {}
+            rows = db_session.query(
+                cls.search_term, cls.product_name, cls.website, cls.price, cls.availability, cls.timestamp
+            ).filter(tuple_(cls.search_term, cls.product_name, cls.website).in_(keys)).all()
+            return {
+                (row.search_term, row.product_name, row.website):
+                    (row.price, row.availability, row.timestamp.date() if row.timestamp else None)
+                for row in rows
+            }
+        
+        @classmethod
+        def matches(cls, search_term):
+            # Filter on search terms containing search_term. Each row refers to the
+            # products row it was copied from, which the full-text index covers
+            if fts_usable(search_term):
+                return cls.product_ref.in_(fts_matches(search_term))
+            return cls.search_term.like(f'%{search_term}%')
+        
+        @classmethod
+        def search_stmt(cls, search_term):
+            # One row per search term that matches; callers keep the newest per product and website
+            return select(
+                cls.product_name, cls.price, cls.currency, cls.website, cls.url,
+                cls.availability, cls.rating, cls.reviews_count, cls.timestamp
+            ).where(cls.matches(search_term))
+    
+    # Full-text index over products.search_term, kept in sync by triggers. The trigram
+    # tokenizer answers the same case-insensitive substring matches as LIKE '%term%'
+    FTS_STATEMENTS = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+        "search_term, content='products', content_rowid='id', tokenize='trigram')",
+        "CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN "
+        "INSERT INTO products_fts(rowid, search_term) VALUES (new.id, new.search_term); END",
+        "CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, search_term) VALUES ('delete', old.id, old.search_term); END",
+        "CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, search_term) VALUES ('delete', old.id, old.search_term); "
+        "INSERT INTO products_fts(rowid, search_term) VALUES (new.id, new.search_term); END",
+    ]
+    
+    @functools.lru_cache(maxsize=None)
+    def fts_available():
+        # Whether products_fts exists; it needs SQLite 3.34+ for the trigram tokenizer
+        with engine.connect() as connection:
+            return connection.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'")
+            ).first() is not None
+    
+    def fts_usable(search_term):
+        # The trigram index only matches substrings of three or more characters
+        return len(search_term) >= 3 and fts_available()
+    
+    def fts_matches(search_term):
+        # Ids of the products whose search term contains search_term, as a subquery
+        phrase = '"' + search_term.replace('"', '""') + '"'
+        return select(text('rowid')).select_from(text('products_fts')).where(
+            text('products_fts MATCH :q').bindparams(q=phrase)
+        )
+    
+    Index('ix_latest_prices_key', LatestPrice.search_term, LatestPrice.product_name, LatestPrice.website, unique=True)
+    # Lets full-text searches look latest prices up by the matching product ids
+    Index('ix_latest_prices_product_ref', LatestPrice.product_ref)
+    
+    # Serve the search term filter and the (product_name, website, max timestamp)
+    # lookups of get_latest_prices and the price history queries from indexes
+    Index('ix_products_search_ts', Product.search_term, Product.product_name, Product.website, Product.timestamp.desc())
+    Index('ix_products_name_site_ts', Product.product_name, Product.website, Product.timestamp)
+    
+    # Indexes created by earlier versions that no query uses any more; lookups by
+    # search term are served by ix_products_search_ts, which leads with it
+    STALE_INDEXES = ('ix_products_search_term', 'ix_products_search_term_nocase')
 else:
     # Dummy implementations for when SQLAlchemy is not available
     Base = None
     db_session = None
+    LatestPrice = None
     
     class Product:
         def __init__(self, product_name, price, website, **kwargs):
@@ -112,10 +276,38 @@ else:
         @classmethod
         def get_latest_prices(cls, search_term):
             return []
+        
+        @classmethod
+        def data_version(cls):
+            return None
 
 def init_db():
     if SQLALCHEMY_AVAILABLE:
         Base.metadata.create_all(bind=engine)
+        with engine.begin() as connection:
+            for name in STALE_INDEXES:
+                connection.execute(text(f'DROP INDEX IF EXISTS {name}'))
+        # create_all only adds indexes along with new tables, so add any missing ones
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(bind=engine, checkfirst=True)
+        
+        # Create the full-text index, filling it from existing rows the first time
+        try:
+            created = not fts_available()
+            with engine.begin() as connection:
+                for statement in FTS_STATEMENTS:
+                    connection.execute(text(statement))
+                if created:
+                    connection.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+        except OperationalError as e:
+            warnings.warn(f"Full-text search is not available, falling back to LIKE: {e}")
+        fts_available.cache_clear()
+        
+        # Fill the latest prices for databases created before the table existed
+        if LatestPrice.query.first() is None:
+            LatestPrice.refresh()
+            db_session.commit()
     else:
         print("SQLAlchemy is not available. Database initialization skipped.")
         print("Data will be exported to CSV files only.") 
\ No newline at end of file
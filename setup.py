@@ -4,8 +4,9 @@ setup(
     name="shop_scraper",
     version="0.1",
     packages=find_packages(),
+    python_requires=">=3.9",
     install_requires=[
-        "scrapy>=2.5.0",
+        "scrapy>=2.7.0",
         "sqlalchemy>=1.4.0",
         "pandas>=1.3.0",
         "plotly>=5.3.0",
@@ -0,0 +1,96 @@
+# Request duplicates filter backed by a Bloom filter
+#
+# Enabled with the DUPEFILTER_CLASS setting
+# See: https://docs.scrapy.org/en/latest/topics/settings.html#dupefilter-class
+
+import math
+
+from scrapy.dupefilters import RFPDupeFilter
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over request fingerprints
+    """
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.count = 0
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+    
+    def _positions(self, fingerprint):
+        # Fingerprints are already SHA1 digests, so the bit positions come straight
+        # from them by double hashing instead of hashing again
+        h1 = int.from_bytes(fingerprint[:8], 'big')
+        h2 = int.from_bytes(fingerprint[8:16], 'big') | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+    
+    def __contains__(self, fingerprint):
+        return all(self.bits[bit >> 3] & (1 << (bit & 7)) for bit in self._positions(fingerprint))
+    
+    def add(self, fingerprint):
+        """
+        Add a fingerprint and return whether it was (probably) already present
+        """
+        present = True
+        for bit in self._positions(fingerprint):
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.bits[byte] & mask:
+                present = False
+                self.bits[byte] |= mask
+        if not present:
+            self.count += 1
+        return present
+
+
+class ScalableBloomFilter:
+    """
+    Chain of Bloom filters that grows as it fills, keeping the overall false
+    positive rate below error_rate however many fingerprints are added
+    """
+    def __init__(self, initial_capacity, error_rate):
+        # Each new filter doubles the capacity and halves the error rate of the
+        # last, so the error rates sum to at most error_rate
+        self.filters = [BloomFilter(initial_capacity, error_rate / 2)]
+    
+    def add(self, fingerprint):
+        """
+        Add a fingerprint and return whether it was (probably) already present
+        """
+        if any(fingerprint in bloom for bloom in self.filters[:-1]):
+            return True
+        
+        current = self.filters[-1]
+        if current.count >= current.capacity:
+            current = BloomFilter(current.capacity * 2, current.error_rate / 2)
+            self.filters.append(current)
+        return current.add(fingerprint)
+
+
+class BloomDupeFilter(RFPDupeFilter):
+    """
+    RFPDupeFilter that remembers request fingerprints in a scalable Bloom filter
+    instead of a set, using about 2 bytes per request instead of about 100.
+    A false positive (at most error_rate) drops a request that was never made
+    """
+    initial_capacity = 1_000_000
+    error_rate = 0.001
+    
+    def __init__(self, path=None, debug=False, *, fingerprinter=None):
+        super().__init__(path, debug, fingerprinter=fingerprinter)
+        self.bloom = ScalableBloomFilter(self.initial_capacity, self.error_rate)
+        
+        # Move fingerprints loaded from JOBDIR/requests.seen into the filter
+        for fingerprint in self.fingerprints:
+            self.bloom.add(bytes.fromhex(fingerprint))
+        self.fingerprints.clear()
+    
+    def request_seen(self, request):
+        fingerprint = self.fingerprinter.fingerprint(request)
+        if self.bloom.add(fingerprint):
+            return True
+        if self.file:
+            self.file.write(fingerprint.hex() + "\n")
+        return False
@@ -3,26 +3,36 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 
-import scrapy
+import sys
+from dataclasses import dataclass, field
 from datetime import datetime
+from typing import Optional
 
+# Slotted instances skip the per-item __dict__ (dataclass slots need Python 3.10+)
+_DATACLASS_OPTIONS = {'slots': True} if sys.version_info >= (3, 10) else {}
 
-class ProductItem(scrapy.Item):
+
+def serialize_timestamp(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+@dataclass(**_DATACLASS_OPTIONS)
+class ProductItem:
     # Basic product information
-    product_name = scrapy.Field()
-    price = scrapy.Field()
-    currency = scrapy.Field()
-    url = scrapy.Field()
-    website = scrapy.Field()
+    product_name: Optional[str] = None
+    price: Optional[float] = None
+    currency: str = 'USD'
+    url: Optional[str] = None
+    website: Optional[str] = None
     
     # Additional product information
-    product_id = scrapy.Field()
-    description = scrapy.Field()
-    image_url = scrapy.Field()
-    availability = scrapy.Field()
-    rating = scrapy.Field()
-    reviews_count = scrapy.Field()
+    product_id: Optional[str] = None
+    description: Optional[str] = None
+    image_url: Optional[str] = None
+    availability: Optional[str] = None
+    rating: Optional[float] = None
+    reviews_count: Optional[int] = None
     
     # Metadata
-    search_term = scrapy.Field()
-    timestamp = scrapy.Field(serializer=lambda x: x.isoformat() if isinstance(x, datetime) else x)
+    search_term: Optional[str] = None
+    timestamp: Optional[datetime] = field(default=None, metadata={'serializer': serialize_timestamp})
@@ -4,22 +4,114 @@
 # See: https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 
 import csv
+import operator
 import os
+import threading
 import warnings
 from datetime import datetime
 from itemadapter import ItemAdapter
+from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
+
+from shop_scraper.items import ProductItem
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
 
 try:
-    from database.models import Product, db_session, SQLALCHEMY_AVAILABLE
+    from database.models import Product, LatestPrice, db_session, SQLALCHEMY_AVAILABLE
 except ImportError:
     warnings.warn("Database module not found. Database functionality will be limited.")
     SQLALCHEMY_AVAILABLE = False
 
 
+class TimestampPipeline:
+    """
+    Pipeline that stamps items with the time they were scraped. The clock is
+    read once per interval by a LoopingCall rather than once per item
+    """
+    # Seconds between clock reads; price history is kept per day, so the
+    # stamps don't need to be finer
+    interval = 1.0
+    
+    def open_spider(self, spider):
+        self._now = datetime.now()
+        self._clock = LoopingCall(self._tick)
+        self._clock.start(self.interval, now=False)
+    
+    def close_spider(self, spider):
+        if self._clock.running:
+            self._clock.stop()
+    
+    def _tick(self):
+        self._now = datetime.now()
+    
+    def process_item(self, item, spider):
+        adapter = ItemAdapter(item)
+        if not adapter.get('timestamp'):
+            adapter['timestamp'] = self._now
+        return item
+
+
 class DatabasePipeline:
     """
     Pipeline for storing scraped items in the database
     """
+    def open_spider(self, spider):
+        # Products are buffered and written in batches, one transaction per batch
+        self._buffer = []
+        self._batch = 200
+        self._touched_terms = set()
+        # Batches are written from the reactor thread pool, one at a time
+        self._lock = threading.Lock()
+    
+    def close_spider(self, spider):
+        return self.flush()
+    
+    def flush(self):
+        """
+        Hand the buffered products to a worker thread and return its Deferred
+        """
+        products, search_terms = self._buffer, list(self._touched_terms)
+        self._buffer = []
+        self._touched_terms = set()
+        return deferToThread(self._write_batch, products, search_terms)
+    
+    def _write_batch(self, products, search_terms):
+        if not products:
+            return
+        
+        # Insert the batch and refresh the latest prices it affects in one transaction
+        with self._lock:
+            products = self._changed(products)
+            if products:
+                db_session.bulk_save_objects(products)
+                LatestPrice.refresh(search_terms)
+            db_session.commit()
+    
+    def _changed(self, products):
+        """
+        Drop products whose price and availability match the latest stored row from
+        the same day, so re-scraping unchanged listings doesn't add rows. Daily price
+        history is unaffected, since the dashboard keeps one point per day anyway
+        """
+        latest = LatestPrice.get_snapshots(list({
+            (product.search_term, product.product_name, product.website) for product in products
+        }))
+        
+        changed = []
+        for product in products:
+            key = (product.search_term, product.product_name, product.website)
+            snapshot = (product.price, product.availability, product.timestamp.date())
+            if latest.get(key) == snapshot:
+                continue
+            latest[key] = snapshot
+            changed.append(product)
+        return changed
+    
     def process_item(self, item, spider):
         if not SQLALCHEMY_AVAILABLE:
             spider.logger.warning("SQLAlchemy is not available. Skipping database storage.")
@@ -27,6 +119,11 @@ class DatabasePipeline:
             
         adapter = ItemAdapter(item)
         
+        # Search terms are stored normalized so prefix lookups match how they were typed
+        search_term = adapter.get('search_term')
+        if search_term:
+            search_term = search_term.strip().lower()
+        
         # Create a new Product instance
         product = Product(
             product_name=adapter.get('product_name'),
@@ -40,24 +137,57 @@ class DatabasePipeline:
             availability=adapter.get('availability'),
             rating=adapter.get('rating'),
             reviews_count=adapter.get('reviews_count'),
-            search_term=adapter.get('search_term'),
-            timestamp=adapter.get('timestamp', datetime.now())
+            search_term=search_term,
+            timestamp=adapter.get('timestamp') or datetime.now()
         )
         
-        # Add to database session
-        db_session.add(product)
-        db_session.commit()
+        # Queue for the next batch insert
+        self._buffer.append(product)
+        self._touched_terms.add(product.search_term)
+        if len(self._buffer) >= self._batch:
+            # The item moves on once its batch is stored, without blocking the reactor
+            return self.flush().addCallback(lambda _: item)
         
         return item
 
 
+class NDJSONWriter:
+    """
+    Writer with the csv.writer interface that emits one JSON object per line
+    """
+    def __init__(self, file, fieldnames):
+        self.file = file
+        self.fieldnames = fieldnames
+    
+    def writerows(self, rows):
+        option = orjson.OPT_APPEND_NEWLINE
+        self.file.write(b''.join(orjson.dumps(dict(zip(self.fieldnames, row)), option=option) for row in rows))
+
+
 class CSVExportPipeline:
     """
-    Pipeline for exporting items to CSV
+    Pipeline for exporting items to CSV, or to newline-delimited JSON when the
+    EXPORT_FORMAT setting is 'ndjson'
     """
+    # Rows are buffered and written together with writerows
+    batch_size = 500
+    
+    # Item fields in export order, with their CSV headers
+    fields = [
+        ('product_name', 'Product Name'), ('price', 'Price'), ('currency', 'Currency'),
+        ('website', 'Website'), ('url', 'URL'), ('product_id', 'Product ID'),
+        ('availability', 'Availability'), ('rating', 'Rating'), ('reviews_count', 'Reviews Count'),
+        ('search_term', 'Search Term'), ('timestamp', 'Timestamp')
+    ]
+    # Reads a whole export row off a ProductItem in one call
+    _row = operator.attrgetter(*[name for name, _ in fields])
+    
     def __init__(self):
         self.file_handles = {}
         self.csv_writers = {}
+        self._rows = {}
+        # File writes happen in the reactor thread pool, one at a time per pipeline
+        self._lock = threading.Lock()
         self.output_dir = 'data/exports'
         os.makedirs(self.output_dir, exist_ok=True)
     
@@ -68,39 +198,79 @@ class CSVExportPipeline:
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
             output_file = f"{spider.name}_{timestamp}.csv"
         
+        export_format = spider.settings.get('EXPORT_FORMAT', 'csv')
+        if export_format == 'ndjson' and not ORJSON_AVAILABLE:
+            spider.logger.warning("orjson is not available. Exporting to CSV instead of NDJSON.")
+            export_format = 'csv'
+        
+        self._rows[spider.name] = []
+        
+        if export_format == 'ndjson':
+            file_path = os.path.join(self.output_dir, os.path.splitext(output_file)[0] + '.ndjson')
+            self.file_handles[spider.name] = open(file_path, 'wb', buffering=1 << 20)
+            self.csv_writers[spider.name] = NDJSONWriter(
+                self.file_handles[spider.name], [name for name, _ in self.fields]
+            )
+            return
+        
         file_path = os.path.join(self.output_dir, output_file)
-        self.file_handles[spider.name] = open(file_path, 'w', newline='', encoding='utf-8')
+        self.file_handles[spider.name] = open(file_path, 'w', newline='', encoding='utf-8', buffering=1 << 20)
         
         # Initialize CSV writer
         self.csv_writers[spider.name] = csv.writer(self.file_handles[spider.name])
         
         # Write header row
-        self.csv_writers[spider.name].writerow([
-            'Product Name', 'Price', 'Currency', 'Website', 'URL', 
-            'Product ID', 'Availability', 'Rating', 'Reviews Count',
-            'Search Term', 'Timestamp'
-        ])
+        self.csv_writers[spider.name].writerow([header for _, header in self.fields])
     
     def close_spider(self, spider):
         if spider.name in self.file_handles:
-            self.file_handles[spider.name].close()
+            return self._flush(spider.name).addCallback(lambda _: self._close(spider.name))
+    
+    def _flush(self, name):
+        """
+        Hand the buffered rows to a worker thread and return its Deferred
+        """
+        rows = self._rows[name]
+        self._rows[name] = []
+        return deferToThread(self._write_rows, name, rows)
+    
+    def _write_rows(self, name, rows):
+        if rows:
+            with self._lock:
+                self.csv_writers[name].writerows(rows)
+    
+    def _close(self, name):
+        with self._lock:
+            self.file_handles[name].close()
     
     def process_item(self, item, spider):
-        adapter = ItemAdapter(item)
-        
         if spider.name in self.csv_writers:
-            self.csv_writers[spider.name].writerow([
-                adapter.get('product_name', ''),
-                adapter.get('price', ''),
-                adapter.get('currency', 'USD'),
-                adapter.get('website', ''),
-                adapter.get('url', ''),
-                adapter.get('product_id', ''),
-                adapter.get('availability', ''),
-                adapter.get('rating', ''),
-                adapter.get('reviews_count', ''),
-                adapter.get('search_term', ''),
-                adapter.get('timestamp', datetime.now()).isoformat() if isinstance(adapter.get('timestamp'), datetime) else adapter.get('timestamp', '')
-            ])
+            if isinstance(item, ProductItem):
+                # Rows are plain tuples, so skip the per-field ItemAdapter lookups
+                row = self._row(item)
+            else:
+                adapter = ItemAdapter(item)
+                row = (
+                    adapter.get('product_name', ''),
+                    adapter.get('price', ''),
+                    adapter.get('currency', 'USD'),
+                    adapter.get('website', ''),
+                    adapter.get('url', ''),
+                    adapter.get('product_id', ''),
+                    adapter.get('availability', ''),
+                    adapter.get('rating', ''),
+                    adapter.get('reviews_count', ''),
+                    adapter.get('search_term', ''),
+                    adapter.get('timestamp', '')
+                )
+            
+            # Timestamp is the last field
+            if isinstance(row[-1], datetime):
+                row = row[:-1] + (row[-1].isoformat(),)
+            
+            rows = self._rows[spider.name]
+            rows.append(row)
+            if len(rows) >= self.batch_size:
+                return self._flush(spider.name).addCallback(lambda _: item)
         
-        return item
+        return item
\ No newline at end of file
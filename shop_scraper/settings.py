@@ -30,6 +30,19 @@ DOWNLOAD_DELAY = 2
 CONCURRENT_REQUESTS_PER_DOMAIN = 4
 #CONCURRENT_REQUESTS_PER_IP = 16
 
+# Multiplex HTTPS requests to each site over one HTTP/2 connection when the
+# h2 package (Twisted[http2]) is installed, instead of a TLS handshake per connection
+try:
+    import h2  # noqa: F401
+    DOWNLOAD_HANDLERS = {
+        "https": "scrapy.core.downloader.handlers.http2.H2DownloadHandler",
+    }
+except ImportError:
+    pass
+
+# Remember seen requests in a Bloom filter, so memory stays bounded on long crawls
+DUPEFILTER_CLASS = "shop_scraper.dupefilter.BloomDupeFilter"
+
 # Disable cookies (enabled by default)
 #COOKIES_ENABLED = False
 
@@ -66,6 +79,7 @@ DEFAULT_REQUEST_HEADERS = {
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
 ITEM_PIPELINES = {
+   "shop_scraper.pipelines.TimestampPipeline": 100,
    "shop_scraper.pipelines.DatabasePipeline": 300,
    "shop_scraper.pipelines.CSVExportPipeline": 400,
 }
@@ -91,6 +105,10 @@ HTTPCACHE_DIR = "httpcache"
 HTTPCACHE_IGNORE_HTTP_CODES = []
 HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
 
+# Format of the files written to data/exports by CSVExportPipeline: "csv", or
+# "ndjson" for newline-delimited JSON written with orjson. The dashboard reads CSV
+EXPORT_FORMAT = "csv"
+
 # Set settings whose default value is deprecated to a future-proof value
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
@@ -1,8 +1,30 @@
 import scrapy
 import re
-from datetime import datetime
 from urllib.parse import urlencode
+from lxml import etree
 from shop_scraper.items import ProductItem
+from shop_scraper.utils import compile_css, first, parse_count, parse_number, parse_price
+
+# Patterns used on every product page, compiled once
+_RATING_RE = re.compile(r'(\d+(\.\d+)?)')
+_REVIEWS_RE = re.compile(r'([\d,]+)')
+
+# Product page selectors, compiled to lxml XPath objects once
+_PRODUCT_XPATHS = {
+    'title': compile_css('#productTitle::text'),
+    'price_whole': compile_css('span.a-price-whole::text'),
+    'price_fraction': compile_css('span.a-price-fraction::text'),
+    'price_text': compile_css('.a-offscreen::text'),
+    'product_id': compile_css('input#ASIN::attr(value)'),
+    'availability': compile_css('#availability span::text'),
+    'rating': compile_css('span.a-icon-alt::text'),
+    'reviews_count': compile_css('#acrCustomerReviewText::text'),
+    'image_url': compile_css('#landingImage::attr(src)'),
+    'description': compile_css('#feature-bullets .a-list-item::text'),
+}
+
+# Product details container that parse_product queries within
+_PPD_XPATH = etree.XPath('//*[@id="ppd"]')
 
 
 class AmazonSpider(scrapy.Spider):
@@ -13,6 +35,8 @@ class AmazonSpider(scrapy.Spider):
         super(AmazonSpider, self).__init__(*args, **kwargs)
         self.product = product
         self.output_file = output_file
+        # Products already taken from a search page, to skip repeats across pages
+        self._seen = set()
         
         if not self.product:
             raise ValueError("Please provide a product name using -a product='product name'")
@@ -38,9 +62,21 @@ class AmazonSpider(scrapy.Spider):
         for product in products:
             # Extract product URL
             product_url = product.css('a.a-link-normal.s-no-outline::attr(href)').get()
-            if product_url:
-                full_url = response.urljoin(product_url)
-                
+            full_url = response.urljoin(product_url) if product_url else None
+            
+            # Sponsored tiles repeat products under different tracking URLs, so key on the ASIN
+            key = product.attrib.get('data-asin') or full_url
+            if key in self._seen:
+                continue
+            if key:
+                self._seen.add(key)
+            
+            # Search tiles carry everything but availability and description,
+            # so the product page is only fetched when name or price are missing
+            item = self.parse_search_item(product, full_url, response.meta.get('search_term'))
+            if item:
+                yield item
+            elif full_url:
                 yield scrapy.Request(
                     url=full_url,
                     callback=self.parse_product,
@@ -56,62 +92,109 @@ class AmazonSpider(scrapy.Spider):
                 meta={'search_term': response.meta.get('search_term')}
             )
     
+    def parse_search_item(self, product, url, search_term):
+        # Build an item from a single search result tile
+        product_name = product.css('h2 a span::text').get() or product.css('h2 span::text').get()
+        if product_name:
+            product_name = product_name.strip()
+        
+        price = None
+        price_text = product.css('span.a-price[data-a-color="base"] span.a-offscreen::text').get()
+        if price_text:
+            price, _ = parse_price(price_text)
+        
+        if not product_name or not price:
+            return None
+        
+        rating = None
+        rating_text = product.css('span.a-icon-alt::text').get()
+        if rating_text:
+            rating_match = _RATING_RE.search(rating_text)
+            if rating_match:
+                rating = float(rating_match.group(1))
+        
+        reviews_count = None
+        reviews_count_text = product.css('span.a-size-base.s-underline-text::text').get()
+        if reviews_count_text:
+            reviews_match = _REVIEWS_RE.search(reviews_count_text)
+            if reviews_match:
+                reviews_count = parse_count(reviews_match.group(1))
+        
+        return ProductItem(
+            product_name=product_name,
+            price=price,
+            currency='USD',
+            url=url,
+            website='Amazon',
+            product_id=product.attrib.get('data-asin'),
+            image_url=product.css('img.s-image::attr(src)').get(),
+            rating=rating,
+            reviews_count=reviews_count,
+            search_term=search_term
+        )
+    
     def parse_product(self, response):
+        # Query within the product details container when present, so lookups
+        # skip the navigation, ads and recommendations around it
+        page = _PPD_XPATH(response.selector.root)
+        page = page[0] if page else response.selector.root
+        
         # Extract product information
-        product_name = response.css('#productTitle::text').get()
+        product_name = first(_PRODUCT_XPATHS['title'], page)
         if product_name:
             product_name = product_name.strip()
         
         # Extract price
-        price_whole = response.css('span.a-price-whole::text').get()
-        price_fraction = response.css('span.a-price-fraction::text').get()
+        price_whole = first(_PRODUCT_XPATHS['price_whole'], page)
+        price_fraction = first(_PRODUCT_XPATHS['price_fraction'], page)
         
         price = None
+        if price_whole:
+            # The decimal point is rendered in its own span, if at all
+            price_whole = price_whole.strip().rstrip('.')
         if price_whole and price_fraction:
-            price = float(f"{price_whole.strip().replace(',', '')}{price_fraction.strip()}")
+            price = parse_number(f"{price_whole}.{price_fraction.strip()}")
         elif price_whole:
-            price = float(price_whole.strip().replace(',', ''))
+            price = parse_number(price_whole)
         else:
             # Try alternative price selectors
-            price_text = response.css('.a-offscreen::text').get()
+            price_text = first(_PRODUCT_XPATHS['price_text'], page)
             if price_text:
-                price_match = re.search(r'[\d,]+\.\d+', price_text)
-                if price_match:
-                    price = float(price_match.group().replace(',', ''))
+                price, _ = parse_price(price_text)
         
         # Skip if no product name or price found
         if not product_name or not price:
             return
         
         # Extract other product information
-        product_id = response.css('input#ASIN::attr(value)').get()
+        product_id = first(_PRODUCT_XPATHS['product_id'], page)
         
         # Extract availability
-        availability = response.css('#availability span::text').get()
+        availability = first(_PRODUCT_XPATHS['availability'], page)
         if availability:
             availability = availability.strip()
         
         # Extract rating
-        rating_text = response.css('span.a-icon-alt::text').get()
+        rating_text = first(_PRODUCT_XPATHS['rating'], page)
         rating = None
         if rating_text:
-            rating_match = re.search(r'(\d+(\.\d+)?)', rating_text)
+            rating_match = _RATING_RE.search(rating_text)
             if rating_match:
                 rating = float(rating_match.group(1))
         
         # Extract reviews count
-        reviews_count_text = response.css('#acrCustomerReviewText::text').get()
+        reviews_count_text = first(_PRODUCT_XPATHS['reviews_count'], page)
         reviews_count = None
         if reviews_count_text:
-            reviews_match = re.search(r'([\d,]+)', reviews_count_text)
+            reviews_match = _REVIEWS_RE.search(reviews_count_text)
             if reviews_match:
-                reviews_count = int(reviews_match.group(1).replace(',', ''))
+                reviews_count = parse_count(reviews_match.group(1))
         
         # Extract image URL
-        image_url = response.css('#landingImage::attr(src)').get()
+        image_url = first(_PRODUCT_XPATHS['image_url'], page)
         
         # Extract description
-        description = ' '.join(response.css('#feature-bullets .a-list-item::text').getall())
+        description = ' '.join(_PRODUCT_XPATHS['description'](page))
         if description:
             description = description.strip()
         
@@ -128,8 +211,7 @@ class AmazonSpider(scrapy.Spider):
             availability=availability,
             rating=rating,
             reviews_count=reviews_count,
-            search_term=response.meta.get('search_term'),
-            timestamp=datetime.now()
+            search_term=response.meta.get('search_term')
         )
         
         yield item 
\ No newline at end of file
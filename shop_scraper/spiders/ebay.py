@@ -1,8 +1,29 @@
 import scrapy
 import re
-from datetime import datetime
 from urllib.parse import urlencode
 from shop_scraper.items import ProductItem
+from shop_scraper.utils import compile_css, first, parse_count, parse_price
+
+# Patterns used on every product page, compiled once
+_RATING_RE = re.compile(r'(\d+(\.\d+)?)')
+_REVIEWS_RE = re.compile(r'([\d,]+)')
+
+# Product page selectors, compiled to lxml XPath objects once
+_PRODUCT_XPATHS = {
+    'title': compile_css('h1.x-item-title__mainTitle span::text'),
+    'title_alt': compile_css('h1.it-ttl::text'),
+    'price': compile_css('div.x-price-primary span::text'),
+    'price_alt': compile_css('span#prcIsum::text'),
+    'product_id': compile_css('div.x-item-number span::text'),
+    'quantity': compile_css('span.qtyTxt span::text'),
+    'sold': compile_css('span.vi-qtyS-hot-red::text'),
+    'rating': compile_css('div.ebay-review-start-rating::text'),
+    'reviews_count': compile_css('div.reviews-right span::text'),
+    'image_url': compile_css('img#icImg::attr(src)'),
+    'image_url_alt': compile_css('div.ux-image-carousel-item img::attr(src)'),
+    'description': compile_css('div.x-item-description div.d-item-description-text::text'),
+    'description_iframe': compile_css('iframe#desc_ifr::attr(src)'),
+}
 
 
 class EbaySpider(scrapy.Spider):
@@ -13,6 +34,8 @@ class EbaySpider(scrapy.Spider):
         super(EbaySpider, self).__init__(*args, **kwargs)
         self.product = product
         self.output_file = output_file
+        # Products already taken from a search page, to skip repeats across pages
+        self._seen = set()
         
         if not self.product:
             raise ValueError("Please provide a product name using -a product='product name'")
@@ -43,7 +66,13 @@ class EbaySpider(scrapy.Spider):
                 
             # Extract product URL
             product_url = product.css('a.s-item__link::attr(href)').get()
-            if product_url:
+            if not product_url:
+                continue
+            
+            # Listing links differ only in their tracking parameters between pages
+            key = product_url.split('?', 1)[0]
+            if key not in self._seen:
+                self._seen.add(key)
                 yield scrapy.Request(
                     url=product_url,
                     callback=self.parse_product,
@@ -60,83 +89,79 @@ class EbaySpider(scrapy.Spider):
             )
     
     def parse_product(self, response):
+        page = response.selector.root
+        
         # Extract product information
-        product_name = response.css('h1.x-item-title__mainTitle span::text').get()
+        product_name = first(_PRODUCT_XPATHS['title'], page)
         if not product_name:
             # Try alternative selector
-            product_name = response.css('h1.it-ttl::text').get()
+            product_name = first(_PRODUCT_XPATHS['title_alt'], page)
         
         if product_name:
             product_name = product_name.strip()
         
         # Extract price
-        price_text = response.css('div.x-price-primary span::text').get()
+        price_text = first(_PRODUCT_XPATHS['price'], page)
         if not price_text:
             # Try alternative selector
-            price_text = response.css('span#prcIsum::text').get()
+            price_text = first(_PRODUCT_XPATHS['price_alt'], page)
         
         price = None
         currency = 'USD'
         
         if price_text:
             # Extract currency and price
-            currency_match = re.search(r'([A-Z]{3})', price_text)
-            if currency_match:
-                currency = currency_match.group(1)
-            
-            price_match = re.search(r'([\d,]+\.\d+)', price_text)
-            if price_match:
-                price = float(price_match.group(1).replace(',', ''))
+            price, currency = parse_price(price_text, currency)
         
         # Skip if no product name or price found
         if not product_name or not price:
             return
         
         # Extract product ID
-        product_id = response.css('div.x-item-number span::text').get()
+        product_id = first(_PRODUCT_XPATHS['product_id'], page)
         if product_id:
-            product_id = product_id.strip().replace('Item number: ', '')
+            product_id = product_id.strip().removeprefix('Item number: ')
         
         # Extract availability
         availability = "Available"  # Default for eBay listings
         
         # Extract quantity available
-        quantity_text = response.css('span.qtyTxt span::text').get()
+        quantity_text = first(_PRODUCT_XPATHS['quantity'], page)
         if quantity_text and "available" in quantity_text.lower():
             availability = quantity_text.strip()
         
         # Extract sold count
-        sold_text = response.css('span.vi-qtyS-hot-red::text').get()
+        sold_text = first(_PRODUCT_XPATHS['sold'], page)
         if sold_text and "sold" in sold_text.lower():
             availability = f"{availability} ({sold_text.strip()})"
         
         # Extract rating
         rating = None
-        rating_text = response.css('div.ebay-review-start-rating::text').get()
+        rating_text = first(_PRODUCT_XPATHS['rating'], page)
         if rating_text:
-            rating_match = re.search(r'(\d+(\.\d+)?)', rating_text)
+            rating_match = _RATING_RE.search(rating_text)
             if rating_match:
                 rating = float(rating_match.group(1))
         
         # Extract reviews count
         reviews_count = None
-        reviews_text = response.css('div.reviews-right span::text').get()
+        reviews_text = first(_PRODUCT_XPATHS['reviews_count'], page)
         if reviews_text:
-            reviews_match = re.search(r'([\d,]+)', reviews_text)
+            reviews_match = _REVIEWS_RE.search(reviews_text)
             if reviews_match:
-                reviews_count = int(reviews_match.group(1).replace(',', ''))
+                reviews_count = parse_count(reviews_match.group(1))
         
         # Extract image URL
-        image_url = response.css('img#icImg::attr(src)').get()
+        image_url = first(_PRODUCT_XPATHS['image_url'], page)
         if not image_url:
             # Try alternative selector
-            image_url = response.css('div.ux-image-carousel-item img::attr(src)').get()
+            image_url = first(_PRODUCT_XPATHS['image_url_alt'], page)
         
         # Extract description
-        description = response.css('div.x-item-description div.d-item-description-text::text').get()
+        description = first(_PRODUCT_XPATHS['description'], page)
         if not description:
             # Try to get from iframe
-            description_iframe = response.css('iframe#desc_ifr::attr(src)').get()
+            description_iframe = first(_PRODUCT_XPATHS['description_iframe'], page)
             if description_iframe:
                 # We could follow this iframe, but for simplicity we'll skip it
                 description = "See full description on eBay"
@@ -157,8 +182,7 @@ class EbaySpider(scrapy.Spider):
             availability=availability,
             rating=rating,
             reviews_count=reviews_count,
-            search_term=response.meta.get('search_term'),
-            timestamp=datetime.now()
+            search_term=response.meta.get('search_term')
         )
         
         yield item 
\ No newline at end of file
@@ -1,19 +1,167 @@
 import scrapy
 import re
 import json
-from datetime import datetime
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urlparse
 from shop_scraper.items import ProductItem
+from shop_scraper.utils import compile_css, compile_css_fields, first, parse_count, parse_price
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# JSON-LD parser; orjson.JSONDecodeError subclasses json.JSONDecodeError
+_json_loads = orjson.loads if ORJSON_AVAILABLE else json.loads
+
+WALMART_ORIGIN = 'https://www.walmart.com'
+
+# Patterns used on every product page, compiled once
+_RATING_RE = re.compile(r'(\d+(?:\.\d+)?)')
+_REVIEWS_RE = re.compile(r'([\d,]+)')
+# A JSON-LD block declaring a Product, found without parsing the block
+_PRODUCT_TYPE_RE = re.compile(r'"@type"\s*:\s*"Product"')
+# Word breaks in availability codes and labels, e.g. 'IN_STOCK' or 'In stock'
+_AVAILABILITY_WORDS_RE = re.compile(r'[\s_]+')
+
+# Links of the product tiles on a search results page
+_PRODUCT_LINKS_XPATH = compile_css('div[data-item-id] a.absolute::attr(href)')
+
+# Product page selectors, compiled to lxml XPath objects once
+_PRODUCT_XPATHS = {
+    'next_data': compile_css('script#__NEXT_DATA__::text'),
+    'json_ld': compile_css('script[type="application/ld+json"]::text'),
+}
+
+# Fallback fields for pages without structured data, read in one XPath evaluation
+_FALLBACK_FIELDS = compile_css_fields(
+    'h1.f3.b.lh-copy.dark-gray.mt1.mb2::text',
+    'span.b.black.f1.mr1::text',
+    'div[data-testid="product-details"] span:contains("Item #")::text',
+    'div[data-testid="fulfillment-shipping-text"]::text',
+    'span.f7.rating-number::text',
+    'a[data-testid="product-reviews-link"] span::text',
+    'img.db.center.mw100.mh100::attr(src)',
+    'div[data-testid="product-description"] div::text',
+)
+
+
+def _next_data_product(page):
+    """
+    The product model from the Next.js __NEXT_DATA__ blob of a product page, or
+    None when the page has no such blob or it is not shaped as expected
+    """
+    next_data = first(_PRODUCT_XPATHS['next_data'], page)
+    if not next_data:
+        return None
+    try:
+        return _json_loads(next_data)['props']['pageProps']['initialData']['data']['product']
+    except (json.JSONDecodeError, KeyError, TypeError):
+        return None
+
+
+def _next_data_search_items(page):
+    """
+    The product tiles from the Next.js __NEXT_DATA__ blob of a search results
+    page, or None when the page has no such blob or it is not shaped as expected
+    """
+    next_data = first(_PRODUCT_XPATHS['next_data'], page)
+    if not next_data:
+        return None
+    try:
+        stacks = _json_loads(next_data)['props']['pageProps']['initialData']['searchResult']['itemStacks']
+        # Stacks also hold ads and banners beside the products
+        return [
+            item for stack in stacks for item in stack.get('items') or ()
+            if item.get('__typename', 'Product') == 'Product'
+        ]
+    except (json.JSONDecodeError, KeyError, TypeError, AttributeError):
+        return None
+
+
+def _normalize_availability(value):
+    """
+    Spell a structured availability value the schema.org way, e.g. 'InStock', so
+    JSON-LD URLs, 'IN_STOCK' model codes and 'In stock' labels store the same text
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip().removeprefix('https://schema.org/').removeprefix('http://schema.org/')
+    words = _AVAILABILITY_WORDS_RE.split(value)
+    if len(words) == 1:
+        return value
+    return ''.join(word.capitalize() for word in words if word)
+
+
+def _extract_next_data(product):
+    """
+    Pull the product fields out of a __NEXT_DATA__ product model, in the same
+    order as _extract_json_ld. Malformed numbers raise TypeError or ValueError
+    """
+    current_price = (product.get('priceInfo') or {}).get('currentPrice') or {}
+    rating = product.get('averageRating')
+    reviews_count = product.get('numberOfReviews')
+    
+    return (
+        product.get('name'),
+        float(current_price['price']) if current_price.get('price') is not None else None,
+        current_price.get('currencyUnit') or 'USD',
+        _normalize_availability(product.get('availabilityStatus')),
+        float(rating) if rating is not None else None,
+        int(reviews_count) if reviews_count is not None else None,
+        (product.get('imageInfo') or {}).get('thumbnailUrl'),
+        product.get('shortDescription'),
+        product.get('usItemId') or product.get('id'),
+    )
+
+
+def _extract_json_ld(data):
+    """
+    Pull the product fields out of a schema.org Product JSON-LD object in one
+    straight pass, as (product_name, price, currency, availability, rating,
+    reviews_count, image_url, description, product_id)
+    """
+    # Offers may also be a list of offers
+    offers = data.get('offers') or {}
+    if isinstance(offers, list):
+        offers = offers[0]
+    aggregate_rating = data.get('aggregateRating') or {}
+    image = data.get('image')
+    
+    return (
+        data.get('name'),
+        float(offers['price']) if 'price' in offers else None,
+        offers.get('priceCurrency', 'USD'),
+        _normalize_availability(offers.get('availability')),
+        float(aggregate_rating['ratingValue']) if 'ratingValue' in aggregate_rating else None,
+        int(aggregate_rating['reviewCount']) if 'reviewCount' in aggregate_rating else None,
+        image[0] if isinstance(image, list) else image,
+        data.get('description'),
+        data.get('sku'),
+    )
 
 
 class WalmartSpider(scrapy.Spider):
     name = "walmart"
     allowed_domains = ["walmart.com"]
+    # Every followed link is resolved and checked against walmart.com in
+    # _site_url, so the per-request offsite regex is not needed. Scrapy 2.11.2
+    # and later also run it as a downloader middleware
+    custom_settings = {
+        'SPIDER_MIDDLEWARES': {
+            'scrapy.spidermiddlewares.offsite.OffsiteMiddleware': None,
+        },
+        'DOWNLOADER_MIDDLEWARES': {
+            'scrapy.downloadermiddlewares.offsite.OffsiteMiddleware': None,
+        },
+    }
     
     def __init__(self, product=None, output_file=None, *args, **kwargs):
         super(WalmartSpider, self).__init__(*args, **kwargs)
         self.product = product
         self.output_file = output_file
+        # Products already taken from a search page, to skip repeats across pages
+        self._seen = set()
         
         if not self.product:
             raise ValueError("Please provide a product name using -a product='product name'")
@@ -24,7 +172,7 @@ class WalmartSpider(scrapy.Spider):
             'q': self.product,
             'sort': 'best_match'
         }
-        search_url = f"https://www.walmart.com/search?{urlencode(params)}"
+        search_url = f"{WALMART_ORIGIN}/search?{urlencode(params)}"
         
         yield scrapy.Request(
             url=search_url,
@@ -33,132 +181,187 @@ class WalmartSpider(scrapy.Spider):
         )
     
     def parse_search_results(self, response):
-        # Extract product listings
-        products = response.css('div[data-item-id]')
-        
-        for product in products:
-            # Extract product URL
-            product_url = product.css('a.absolute::attr(href)').get()
-            if product_url:
-                full_url = response.urljoin(product_url)
-                
+        page = response.selector.root
+        search_term = response.meta.get('search_term')
+        
+        # Follow pagination first, ahead of this page's products, so the next
+        # results page downloads while the product pages are still in flight
+        next_page = response.css('a[aria-label="Next Page"]::attr(href)').get()
+        next_url = self._site_url(response, next_page) if next_page else None
+        if next_url:
+            yield scrapy.Request(
+                url=next_url,
+                callback=self.parse_search_results,
+                meta={'search_term': search_term},
+                priority=1
+            )
+        
+        # The results page embeds its tiles' data in __NEXT_DATA__, so products come
+        # straight from it and only tiles missing a name or price need their page.
+        # What it produces is counted, so a changed tile layout that yields nothing
+        # still falls back to the product links below
+        scheduled = 0
+        search_items = _next_data_search_items(page) or ()
+        for search_item in search_items:
+            product_url = search_item.get('canonicalUrl')
+            if not product_url or product_url in self._seen:
+                continue
+            self._seen.add(product_url)
+            
+            full_url = self._site_url(response, product_url)
+            if not full_url:
+                continue
+            
+            scheduled += 1
+            item = self.parse_search_item(search_item, full_url, search_term)
+            if item:
+                yield item
+            else:
                 yield scrapy.Request(
                     url=full_url,
                     callback=self.parse_product,
-                    meta={'search_term': response.meta.get('search_term')}
+                    meta={'search_term': search_term},
+                    priority=0
                 )
         
-        # Follow pagination if available
-        next_page = response.css('a[aria-label="Next Page"]::attr(href)').get()
-        if next_page:
+        if scheduled:
+            return
+        
+        # Otherwise extract every product link on the page in a single tree walk;
+        # a tile can hold more than one link to its product and overlapping pages
+        # repeat products, so each URL is scheduled once per crawl
+        for product_url in _PRODUCT_LINKS_XPATH(page):
+            if product_url in self._seen:
+                continue
+            self._seen.add(product_url)
+            
+            full_url = self._site_url(response, product_url)
+            if not full_url:
+                continue
+            
             yield scrapy.Request(
-                url=response.urljoin(next_page),
-                callback=self.parse_search_results,
-                meta={'search_term': response.meta.get('search_term')}
+                url=full_url,
+                callback=self.parse_product,
+                meta={'search_term': search_term},
+                priority=0
             )
     
+    def _site_url(self, response, href):
+        # Tile links are site-relative paths, which need no full urljoin
+        if href.startswith('/') and not href.startswith('//'):
+            return WALMART_ORIGIN + href
+        
+        # Anything else may point off the site, e.g. to sponsored listings, so
+        # resolve it and keep it only when it stays on walmart.com
+        url = response.urljoin(href)
+        host = urlparse(url).hostname or ''
+        if host != 'walmart.com' and not host.endswith('.walmart.com'):
+            return None
+        return url
+    
+    def parse_search_item(self, search_item, url, search_term):
+        # Build an item from a single __NEXT_DATA__ search result
+        product_name = search_item.get('name')
+        
+        price = search_item.get('price')
+        if price is None:
+            price = ((search_item.get('priceInfo') or {}).get('currentPrice') or {}).get('price')
+        
+        if not product_name or not price:
+            return None
+        
+        rating = search_item.get('averageRating')
+        reviews_count = search_item.get('numberOfReviews')
+        try:
+            price = float(price)
+            rating = float(rating) if rating is not None else None
+            reviews_count = int(reviews_count) if reviews_count is not None else None
+        except (TypeError, ValueError):
+            # Leave malformed tiles to their product page
+            return None
+        
+        availability = (search_item.get('availabilityStatusV2') or {}).get('value')
+        
+        return ProductItem(
+            product_name=product_name,
+            price=price,
+            currency='USD',
+            url=url,
+            website='Walmart',
+            product_id=search_item.get('usItemId'),
+            image_url=(search_item.get('imageInfo') or {}).get('thumbnailUrl') or search_item.get('image'),
+            availability=_normalize_availability(availability or search_item.get('availabilityStatusDisplayValue')),
+            rating=rating,
+            reviews_count=reviews_count,
+            search_term=search_term
+        )
+    
     def parse_product(self, response):
+        page = response.selector.root
+        
+        # The __NEXT_DATA__ product model holds everything in one parse, so the
+        # JSON-LD blocks are only scanned when it is missing
+        next_product = _next_data_product(page)
+        next_fields = None
+        if next_product:
+            try:
+                next_fields = _extract_next_data(next_product)
+            except (AttributeError, TypeError, ValueError):
+                # A malformed model falls through to JSON-LD or the CSS selectors
+                next_fields = None
+        
         # Try to extract product data from JSON-LD
-        json_ld = response.css('script[type="application/ld+json"]::text').getall()
+        json_ld = _PRODUCT_XPATHS['json_ld'](page) if not next_fields else []
         product_data = None
         
         for json_text in json_ld:
+            # Skip breadcrumb, organization and other blocks without parsing them
+            if not _PRODUCT_TYPE_RE.search(json_text):
+                continue
             try:
-                data = json.loads(json_text)
+                data = _json_loads(json_text)
                 if '@type' in data and data['@type'] == 'Product':
                     product_data = data
                     break
             except json.JSONDecodeError:
                 continue
         
+        # Extract product information from __NEXT_DATA__ if available
+        if next_fields:
+            (product_name, price, currency, availability, rating, reviews_count,
+             image_url, description, product_id) = next_fields
+        
         # Extract product information from JSON-LD if available
-        if product_data:
-            product_name = product_data.get('name')
-            
-            # Extract price
-            price = None
-            if 'offers' in product_data and 'price' in product_data['offers']:
-                price = float(product_data['offers']['price'])
-            
-            # Extract currency
-            currency = 'USD'
-            if 'offers' in product_data and 'priceCurrency' in product_data['offers']:
-                currency = product_data['offers']['priceCurrency']
-            
-            # Extract availability
-            availability = None
-            if 'offers' in product_data and 'availability' in product_data['offers']:
-                availability = product_data['offers']['availability'].replace('http://schema.org/', '')
-            
-            # Extract rating
-            rating = None
-            if 'aggregateRating' in product_data and 'ratingValue' in product_data['aggregateRating']:
-                rating = float(product_data['aggregateRating']['ratingValue'])
-            
-            # Extract reviews count
-            reviews_count = None
-            if 'aggregateRating' in product_data and 'reviewCount' in product_data['aggregateRating']:
-                reviews_count = int(product_data['aggregateRating']['reviewCount'])
-            
-            # Extract image URL
-            image_url = None
-            if 'image' in product_data:
-                if isinstance(product_data['image'], list):
-                    image_url = product_data['image'][0]
-                else:
-                    image_url = product_data['image']
-            
-            # Extract description
-            description = product_data.get('description')
-            
-            # Extract product ID
-            product_id = None
-            if 'sku' in product_data:
-                product_id = product_data['sku']
-            
+        elif product_data:
+            (product_name, price, currency, availability, rating, reviews_count,
+             image_url, description, product_id) = _extract_json_ld(product_data)
+        
         else:
             # Fallback to CSS selectors if JSON-LD is not available
-            product_name = response.css('h1.f3.b.lh-copy.dark-gray.mt1.mb2::text').get()
-            if product_name:
-                product_name = product_name.strip()
+            (product_name, price_text, product_id, availability, rating_text,
+             reviews_count_text, image_url, description) = _FALLBACK_FIELDS(page)
             
             # Extract price
-            price_text = response.css('span.b.black.f1.mr1::text').get()
             price = None
             if price_text:
-                price_match = re.search(r'([\d,]+\.\d+)', price_text)
-                if price_match:
-                    price = float(price_match.group(1).replace(',', ''))
+                price, _ = parse_price(price_text)
             
             # Default values
             currency = 'USD'
-            product_id = response.css('div[data-testid="product-details"] span:contains("Item #")::text').get()
             if product_id:
-                product_id = product_id.replace('Item #', '').strip()
-            
-            availability = response.css('div[data-testid="fulfillment-shipping-text"]::text').get()
-            if availability:
-                availability = availability.strip()
+                product_id = product_id.removeprefix('Item #').strip()
             
-            rating_text = response.css('span.f7.rating-number::text').get()
             rating = None
             if rating_text:
-                rating_match = re.search(r'(\d+(\.\d+)?)', rating_text)
+                rating_match = _RATING_RE.search(rating_text)
                 if rating_match:
                     rating = float(rating_match.group(1))
             
-            reviews_count_text = response.css('a[data-testid="product-reviews-link"] span::text').get()
             reviews_count = None
             if reviews_count_text:
-                reviews_match = re.search(r'([\d,]+)', reviews_count_text)
+                reviews_match = _REVIEWS_RE.search(reviews_count_text)
                 if reviews_match:
-                    reviews_count = int(reviews_match.group(1).replace(',', ''))
-            
-            image_url = response.css('img.db.center.mw100.mh100::attr(src)').get()
-            
-            description = response.css('div[data-testid="product-description"] div::text').get()
-            if description:
-                description = description.strip()
+                    reviews_count = parse_count(reviews_match.group(1))
         
         # Skip if no product name or price found
         if not product_name or not price:
@@ -177,8 +380,7 @@ class WalmartSpider(scrapy.Spider):
             availability=availability,
             rating=rating,
             reviews_count=reviews_count,
-            search_term=response.meta.get('search_term'),
-            timestamp=datetime.now()
+            search_term=response.meta.get('search_term')
         )
         
         yield item 
\ No newline at end of file
@@ -0,0 +1,83 @@
+# Parsing helpers shared by the spiders
+
+import re
+
+from lxml import etree
+from parsel.csstranslator import HTMLTranslator
+
+# A number with thousands separators and a decimal part, e.g. '1,299.99'
+_PRICE_RE = re.compile(r'([\d,]+\.\d+)')
+# A three-letter currency code, e.g. 'GBP' in 'GBP 12.50'
+_CURRENCY_RE = re.compile(r'([A-Z]{3})')
+# Deletes thousands separators in a single translate pass
+_SEPARATORS = str.maketrans('', '', ',')
+
+
+def parse_number(text):
+    """
+    Parse a number with thousands separators, e.g. '1,299' or '1,299.99'
+    """
+    return float(text.translate(_SEPARATORS))
+
+
+def parse_count(text):
+    """
+    Parse a whole number with thousands separators, e.g. '12,345'
+    """
+    return int(text.translate(_SEPARATORS))
+
+
+def parse_price(text, currency='USD'):
+    """
+    Extract (price, currency) from a price label such as '$1,299.99' or
+    'GBP 12.50'. The price is None when the label has no decimal number, and the
+    currency is the given default when the label names none
+    """
+    price_match = _PRICE_RE.search(text)
+    price = parse_number(price_match.group(1)) if price_match else None
+    
+    currency_match = _CURRENCY_RE.search(text)
+    if currency_match:
+        currency = currency_match.group(1)
+    return price, currency
+
+
+_css_to_xpath = HTMLTranslator().css_to_xpath
+
+
+def compile_css(css):
+    """
+    Compile a parsel CSS selector (::text and ::attr() included) to an lxml XPath
+    object, to be called directly on response.selector.root or an element of it.
+    smart_strings=False keeps the extracted strings from pinning the parsed page
+    """
+    return etree.XPath(_css_to_xpath(css), smart_strings=False)
+
+
+# Joins the per-field strings of compile_css_fields; a private-use character,
+# since XPath string literals cannot hold control characters
+_FIELD_SEPARATOR = '\ue000'
+
+
+def compile_css_fields(*css):
+    """
+    Compile several CSS selectors into a single XPath evaluation. The returned
+    function gives the first result of each selector, stripped, as a tuple with
+    None where a selector matched nothing
+    """
+    parts = []
+    for selector in css:
+        parts += [f'string({_css_to_xpath(selector)})', f'"{_FIELD_SEPARATOR}"']
+    xpath = etree.XPath(f'concat({", ".join(parts[:-1])}, "")', smart_strings=False)
+    
+    def extract(node):
+        return tuple(value.strip() or None for value in xpath(node).split(_FIELD_SEPARATOR))
+    return extract
+
+
+def first(xpath, node):
+    """
+    Like SelectorList.get(): the first result of a compiled XPath, or None
+    """
+    results = xpath(node)
+    return results[0] if results else None
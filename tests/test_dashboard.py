@@ -0,0 +1,63 @@
+import importlib
+import sys
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+
+
+@pytest.fixture
+def dashboard(tmp_path, monkeypatch):
+    # The database lives at data/products.db relative to the working directory,
+    # so importing from a temporary directory leaves the real one untouched
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.syspath_prepend(str(ROOT))
+    for name in ('dashboard', 'database.models', 'database'):
+        sys.modules.pop(name, None)
+    return importlib.import_module('dashboard')
+
+
+def test_render_results_without_ratings(dashboard, monkeypatch):
+    # New listings often have no rating, and a column that is NULL in every row
+    # is read back as object dtype full of None
+    latest = pd.DataFrame({
+        'product_name': ['TV', 'Radio'],
+        'price': [199.0, 24.5],
+        'currency': ['USD', None],
+        'website': ['Walmart', 'eBay'],
+        'url': ['https://www.walmart.com/ip/1', None],
+        'availability': [None, 'IN_STOCK'],
+        'rating': pd.Series([None, None], dtype=object),
+        'reviews_count': pd.Series([None, None], dtype=object),
+        'timestamp': pd.to_datetime(['2024-01-01', '2024-01-02']),
+    })
+    monkeypatch.setattr(dashboard, 'get_latest_prices', lambda search_term, data_version: latest)
+    
+    results = dashboard._render_results('tv', None)
+    
+    assert [row['rating'] for row in results['table']] == ['No ratings', 'No ratings']
+    assert [row['price'] for row in results['table']] == ['24.50 USD', '199.00 USD']
+
+
+@pytest.mark.parametrize('use_pyarrow', [False, True])
+def test_exports_without_search_term_are_skipped(dashboard, monkeypatch, tmp_path, use_pyarrow):
+    if use_pyarrow and not dashboard.PYARROW_AVAILABLE:
+        pytest.skip("pyarrow is not installed")
+    monkeypatch.setattr(dashboard, 'PYARROW_AVAILABLE', use_pyarrow)
+    
+    exports_dir = tmp_path / 'exports'
+    exports_dir.mkdir()
+    header = 'Product Name,Price,Currency,Website,URL,Product ID,Availability,Rating,Reviews Count,Search Term,Timestamp'
+    (exports_dir / 'complete.csv').write_text(
+        header + '\nTV,199.0,USD,Walmart,https://www.walmart.com/ip/1,1,InStock,4.5,10,tv,2024-01-01T00:00:00\n'
+    )
+    # Older exports without a search term can't be matched to a search
+    (exports_dir / 'no_search_term.csv').write_text(
+        'Product Name,Price,Website,Timestamp\nRadio,24.5,eBay,2024-01-01T00:00:00\n'
+    )
+    
+    df = dashboard._load_exports(str(exports_dir), dashboard._exports_signature(str(exports_dir)))
+    
+    assert df['Product Name'].tolist() == ['TV']